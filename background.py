@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "3"))
+BACKGROUND_QUEUE_SIZE = int(os.getenv("BACKGROUND_QUEUE_SIZE", "1000"))
+BACKGROUND_DRAIN_SECONDS = float(os.getenv("BACKGROUND_DRAIN_SECONDS", "20"))
+BACKGROUND_PENDING_FILE = Path(os.getenv("BACKGROUND_PENDING_FILE", "pending_tasks.jsonl"))
+BACKGROUND_SUBMIT_TIMEOUT = float(os.getenv("BACKGROUND_SUBMIT_TIMEOUT", "30"))
+BACKGROUND_SPILL_RETRY_SECONDS = float(os.getenv("BACKGROUND_SPILL_RETRY_SECONDS", "5"))
+
+# Tasks are submitted by name with JSON arguments, so whatever is left at
+# shutdown can be written to disk and run again by the next process.
+_tasks = {}
+
+
+def task(name: str):
+    """Registers a function as a background task; its arguments must be JSON serializable"""
+    def register(fn):
+        _tasks[name] = fn
+        return fn
+    return register
+
+
+class _Job:
+    def __init__(self, name: str, kwargs: dict, job_id: str = None, submitted: float = None):
+        self.id = job_id or str(uuid.uuid4())
+        self.name = name
+        self.kwargs = kwargs
+        self.submitted = submitted or time.time()
+        self.future = Future()
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "kwargs": self.kwargs, "submitted": self.submitted}
+
+
+class BackgroundExecutor:
+    def __init__(self, workers: int, queue_size: int, pending_file: Path):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pending_file = pending_file
+        self._queue = deque()
+        self._threads = []
+        self._running = {}
+        # Taking a job off the queue and marking it running happen under the
+        # same lock shutdown uses to collect unfinished jobs, so none slips through
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._accepting = True
+        self._stopped = False
+        self._replay_lock = threading.Lock()
+        self._replaying = True
+        self._next_replay = 0.0
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "spilled": 0, "persisted": 0, "replayed": 0,
+            "max_queue_depth": 0, "wait_seconds": 0.0, "run_seconds": 0.0,
+        }
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def start(self, replay: bool = True):
+        """
+        Starts the workers and queues the tasks a previous process left
+        unfinished. Without replay, the pending file is left to another
+        process (e.g. the server, when this is a CLI run).
+        """
+        self._replaying = replay
+        self._ensure_workers()
+        self._replay_pending()
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"background-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {self.workers} background worker/s")
+
+    def shutdown(self, deadline: float = BACKGROUND_DRAIN_SECONDS):
+        """
+        Stops accepting tasks and waits up to `deadline` seconds (None: as long
+        as it takes) for queued and running ones. Whatever hasn't finished by
+        then is persisted.
+        """
+        with self._changed:
+            self._accepting = False
+            self._changed.notify_all()
+            logger.info(f"Draining background tasks: {len(self._queue)} queued, {len(self._running)} running")
+
+        # Workers exit once the queue is empty
+        end = time.monotonic() + deadline if deadline is not None else None
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, end - time.monotonic()) if end is not None else None)
+
+        with self._changed:
+            self._stopped = True
+            # Running tasks past the deadline run again next time (at least once)
+            unfinished = list(self._queue) + list(self._running.values())
+            self._queue.clear()
+            self._changed.notify_all()
+
+        if unfinished:
+            self._persist(unfinished)
+            logger.warning(f"{len(unfinished)} background task/s unfinished at shutdown, persisted to {self.pending_file}")
+        else:
+            logger.info("All background tasks finished")
+
+    # -----------------------------
+    # Submitting
+    # -----------------------------
+    def submit(self, name: str, **kwargs) -> Future:
+        """
+        Queues a task without blocking, for use on the event loop. If the queue
+        is full the task is spilled to the pending file, which idle workers pick
+        up again, and the returned future fails with queue.Full.
+        """
+        return self._submit(_Job(name, kwargs), timeout=0)
+
+    def submit_wait(self, name: str, timeout: float = BACKGROUND_SUBMIT_TIMEOUT, **kwargs) -> Future:
+        """Like submit, but waits up to `timeout` seconds for room in the queue first (back-pressure)"""
+        return self._submit(_Job(name, kwargs), timeout=timeout)
+
+    def _submit(self, job: _Job, timeout: float) -> Future:
+        if job.name not in _tasks:
+            raise ValueError(f"Unknown background task: {job.name}")
+
+        self._ensure_workers()
+        with self._changed:
+            self._changed.wait_for(lambda: len(self._queue) < self.queue_size or not self._accepting, timeout=timeout)
+            if self._accepting and len(self._queue) < self.queue_size:
+                self._queue.append(job)
+                self._stats["submitted"] += 1
+                self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+                self._changed.notify_all()
+                return job.future
+            self._stats["spilled"] += 1
+
+        logger.warning(f"Background queue full or closed, spilling task {job.name} ({job.id}) to {self.pending_file}")
+        self._persist([job])
+        job.future.set_exception(queue.Full())
+        return job.future
+
+    # -----------------------------
+    # Workers
+    # -----------------------------
+    def _next_job(self):
+        """Next job (already marked running), or None once the worker should exit"""
+        while True:
+            with self._changed:
+                while not self._queue and self._accepting and not self._stopped:
+                    if not self._changed.wait(timeout=BACKGROUND_SPILL_RETRY_SECONDS):
+                        break
+                if self._stopped or (not self._queue and not self._accepting):
+                    return None
+                if self._queue:
+                    job = self._queue.popleft()
+                    self._running[job.id] = job
+                    self._changed.notify_all()
+                    return job
+
+            # Idle: pick up tasks that were spilled while the queue was full
+            self._replay_pending(throttled=True)
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            started = time.time()
+            try:
+                with tracing.span(f"background.{job.name}", task_id=job.id):
+                    result = _tasks[job.name](**job.kwargs)
+                job.future.set_result(result)
+                outcome = "completed"
+            except Exception as e:
+                logger.error(f"Background task {job.name} ({job.id}) failed: {e}", exc_info=True)
+                job.future.set_exception(e)
+                outcome = "failed"
+
+            with self._changed:
+                del self._running[job.id]
+                self._stats[outcome] += 1
+                self._stats["wait_seconds"] += started - job.submitted
+                self._stats["run_seconds"] += time.time() - started
+                self._changed.notify_all()
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def _persist(self, jobs):
+        with self._lock:
+            with open(self.pending_file, "a", encoding="utf-8") as f:
+                for job in jobs:
+                    f.write(json.dumps(job.to_dict(), default=str) + "\n")
+            self._stats["persisted"] += len(jobs)
+
+    def _replay_pending(self, throttled: bool = False):
+        if not self._replaying:
+            return
+        if throttled and time.monotonic() < self._next_replay:
+            return
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_replay = time.monotonic() + BACKGROUND_SPILL_RETRY_SECONDS
+
+            # Take the file over first, so only one process replays these tasks.
+            # Holding the lock keeps this process from appending meanwhile.
+            replaying = self.pending_file.with_suffix(f".replay-{os.getpid()}")
+            jobs = []
+            with self._lock:
+                try:
+                    self.pending_file.replace(replaying)
+                except FileNotFoundError:
+                    return
+
+                with open(replaying, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            data = json.loads(line)
+                            jobs.append(_Job(data["name"], data["kwargs"], data["id"], data["submitted"]))
+
+            logger.info(f"Replaying {len(jobs)} persisted background task/s")
+            leftover = []
+            with self._changed:
+                for job in jobs:
+                    if job.name not in _tasks:
+                        logger.error(f"Dropping persisted task with unknown name {job.name} ({job.id})")
+                    elif self._accepting and len(self._queue) < self.queue_size:
+                        self._queue.append(job)
+                        self._stats["replayed"] += 1
+                    else:
+                        leftover.append(job)
+                self._changed.notify_all()
+            if leftover:
+                self._persist(leftover)
+            replaying.unlink()
+        finally:
+            self._replay_lock.release()
+
+    # -----------------------------
+    # Metrics
+    # -----------------------------
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            running = len(self._running)
+            queue_depth = len(self._queue)
+        finished = stats["completed"] + stats["failed"]
+        return {
+            "workers": self.workers,
+            "accepting": self._accepting,
+            "queue_depth": queue_depth,
+            "queue_capacity": self.queue_size,
+            "running": running,
+            "submitted": stats["submitted"],
+            "completed": stats["completed"],
+            "failed": stats["failed"],
+            "spilled": stats["spilled"],
+            "persisted": stats["persisted"],
+            "replayed": stats["replayed"],
+            "pending_file_bytes": self.pending_file.stat().st_size if self.pending_file.exists() else 0,
+            "max_queue_depth": stats["max_queue_depth"],
+            "avg_wait_ms": round(stats["wait_seconds"] / finished * 1000, 1) if finished else 0.0,
+            "avg_run_ms": round(stats["run_seconds"] / finished * 1000, 1) if finished else 0.0,
+        }
+
+
+executor = BackgroundExecutor(BACKGROUND_WORKERS, BACKGROUND_QUEUE_SIZE, BACKGROUND_PENDING_FILE)
+
+start = executor.start
+submit = executor.submit
+submit_wait = executor.submit_wait
+shutdown = executor.shutdown
+metrics = executor.metrics
@@ -1,18 +1,62 @@
 import os
-from sqlalchemy import create_engine
+import threading
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
 from db.schema import Base
 
+# -----------------------------
+# SQLite tuning
+# -----------------------------
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# SQLite allows a single writer at a time. Writers of this process queue up
+# on this lock, writers of other processes wait on busy_timeout.
+sqlite_write_lock = threading.Lock()
+
+
+def create_sqlite_engine(url: str):
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    )
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see on_begin)
+        dbapi_connection.isolation_level = None
+
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(conn):
+        # Writers take the write lock up front, so a transaction never has
+        # to upgrade from reading to writing (which fails instead of waiting)
+        mode = conn.get_execution_options().get("sqlite_begin", "DEFERRED")
+        conn.exec_driver_sql(f"BEGIN {mode}")
+
+    return engine
+
+
+def is_sqlite(engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
 # -----------------------------
 # Source DB (SQLite)
 # -----------------------------
 SQLITE_DATABASE_URL = "sqlite:///./orders.db"
 
-sqlite_engine = create_engine(
-    SQLITE_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+sqlite_engine = create_sqlite_engine(SQLITE_DATABASE_URL)
 
 SQLiteSessionLocal = sessionmaker(
     autocommit=False,
@@ -21,26 +65,34 @@ SQLiteSessionLocal = sessionmaker(
 )
 
 # -----------------------------
-# Target DB (PostgreSQL)
+# Target DB (PostgreSQL, or SQLite for single-node deployments)
 # -----------------------------
-POSTGRES_DATABASE_URL = os.getenv("DATABASE_URL")
+# SQLite is opt-in (DATABASE_URL=sqlite:///...), a missing URL is an error
+DATABASE_URL = os.getenv("DATABASE_URL")
 
-postgres_engine = create_engine(
-    POSTGRES_DATABASE_URL,
-    pool_pre_ping=True
-)
+if not DATABASE_URL:
+    raise RuntimeError("DATABASE_URL is not set")
+elif DATABASE_URL == SQLITE_DATABASE_URL:
+    engine = sqlite_engine
+elif DATABASE_URL.startswith("sqlite"):
+    engine = create_sqlite_engine(DATABASE_URL)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True
+    )
 
-PostgresSessionLocal = sessionmaker(
+SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
-    bind=postgres_engine
+    bind=engine
 )
 
 # -----------------------------
-# Init PostgreSQL ONLY
+# Init target DB ONLY
 # -----------------------------
 def init_db():
-    Base.metadata.create_all(bind=postgres_engine)
+    Base.metadata.create_all(bind=engine)
 
 # -----------------------------
 # Dependencies
@@ -55,8 +107,24 @@ def get_sqlite_db():
 
 @contextmanager
 def get_db():
-    db = PostgresSessionLocal()
+    db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+@contextmanager
+def get_write_db():
+    """Session for transactions that write; serialized when running on SQLite"""
+    if not is_sqlite(engine):
+        with get_db() as db:
+            yield db
+        return
+
+    with sqlite_write_lock:
+        db = SessionLocal()
+        try:
+            db.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+            yield db
+        finally:
+            db.close()
@@ -1,8 +1,13 @@
-from db.database import get_sqlite_db, get_db
+from db import database
+from db.database import get_sqlite_db, get_write_db
 from db.schema import OrderDB
 
 def migrate_orders():
-    with get_sqlite_db() as sqlite_db, get_db() as pg_db:
+    if database.engine is database.sqlite_engine:
+        # Source and target are the same file
+        return {"migrated": 0}
+
+    with get_sqlite_db() as sqlite_db, get_write_db() as pg_db:
         orders = sqlite_db.query(OrderDB).all()
 
         for order in orders:
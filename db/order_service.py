@@ -1,43 +1,56 @@
 from fastapi import HTTPException
 from datetime import datetime
+from sqlalchemy import insert, or_
 import uuid
 from typing import List
 import logging
 
-from db.database import get_db
+import order_feed
+import tracing
+from db import search
+from db.database import get_db, get_write_db
 from db.schema import OrderDB
-from models import Order, Customer, Tree, Size, Package, Delivery, PaymentMethod
+from models import Order, Customer, Tree, Size, Package, Delivery, PaymentMethod, OrderStatus
 
 logger = logging.getLogger(__name__)
 
 
+def _order_row(order: Order) -> dict:
+    return dict(
+        id=order.id,
+        order_date=datetime.now(),
+        price=order.price,
+        first_name=order.customer.first_name,
+        last_name=order.customer.last_name,
+        address=order.customer.address,
+        postal_code=order.customer.postal_code,
+        city=order.customer.city,
+        phone=order.customer.phone,
+        email=str(order.customer.email),
+        tree=order.tree.value,
+        size=order.size.value,
+        package=order.package.value,
+        delivery=order.delivery.value,
+        tree_stand=order.tree_stand,
+        payment_method=order.payment_method.value
+    )
+
+
+def _order_dict(db_order: OrderDB) -> dict:
+    return {c.name: getattr(db_order, c.name) for c in OrderDB.__table__.columns}
+
+
 def create_order(order: Order) -> OrderDB:
     """Create a new order"""
     logger.info("Creating new order")
     try:
-        with get_db() as db:
-            db_order = OrderDB(
-                id=order.id,
-                order_date=datetime.now(),
-                price=order.price,
-                first_name=order.customer.first_name,
-                last_name=order.customer.last_name,
-                address=order.customer.address,
-                postal_code=order.customer.postal_code,
-                city=order.customer.city,
-                phone=order.customer.phone,
-                email=str(order.customer.email),
-                tree=order.tree.value,
-                size=order.size.value,
-                package=order.package.value,
-                delivery=order.delivery.value,
-                tree_stand=order.tree_stand,
-                payment_method=order.payment_method.value
-            )
+        with tracing.span("order_service.create_order"), get_write_db() as db:
+            db_order = OrderDB(**_order_row(order))
 
             db.add(db_order)
             db.commit()
             db.refresh(db_order)
+            order_feed.publish("order.created", _order_dict(db_order))
 
             logger.info(f"Order created successfully: {order.id} for customer {order.customer.email}")
             return db_order
@@ -47,6 +60,25 @@ def create_order(order: Order) -> OrderDB:
         raise
 
 
+def create_orders(orders: List[Order]):
+    """Create many orders with a single multi-row insert and one commit"""
+    logger.info(f"Creating {len(orders)} orders")
+    try:
+        with tracing.span("order_service.create_orders", count=len(orders)), get_write_db() as db:
+            rows = [_order_row(order) for order in orders]
+            db.execute(insert(OrderDB), rows)
+            db.commit()
+
+            for row in rows:
+                order_feed.publish("order.created", {**row, "status": OrderStatus.Received.value})
+
+            logger.info(f"{len(orders)} order/s created successfully")
+
+    except Exception as e:
+        logger.error(f"Failed to create orders: {str(e)}", exc_info=True)
+        raise
+
+
 def get_all_orders() -> List[OrderDB]:
     """Get all orders"""
     logger.info("Fetching all orders")
@@ -61,6 +93,61 @@ def get_all_orders() -> List[OrderDB]:
         raise
 
 
+def get_open_orders() -> List[OrderDB]:
+    """Get all orders that have not been processed yet"""
+    logger.info("Fetching open orders")
+    try:
+        with get_db() as db:
+            orders = db.query(OrderDB).filter(OrderDB.status == OrderStatus.Received.value).all()
+            logger.info(f"Retrieved {len(orders)} open order/s")
+            return orders
+
+    except Exception as e:
+        logger.error(f"Failed to fetch open orders: {str(e)}", exc_info=True)
+        raise
+
+
+def get_orders_between(start: datetime, end: datetime) -> List[OrderDB]:
+    """Get all orders placed in [start, end) that weren't cancelled, e.g. for invoicing"""
+    logger.info(f"Fetching orders from {start} to {end}")
+    try:
+        with get_db() as db:
+            orders = (
+                db.query(OrderDB)
+                .filter(OrderDB.order_date >= start, OrderDB.order_date < end)
+                .filter(or_(OrderDB.status.is_(None), OrderDB.status != OrderStatus.Cancelled.value))
+                .order_by(OrderDB.order_date)
+                .all()
+            )
+            logger.info(f"Retrieved {len(orders)} order/s")
+            return orders
+
+    except Exception as e:
+        logger.error(f"Failed to fetch orders from {start} to {end}: {str(e)}", exc_info=True)
+        raise
+
+
+def search_orders(query: str, limit: int = 20, offset: int = 0) -> dict:
+    """Search orders by customer name, address, city, phone or email"""
+    logger.info(f"Searching orders: {query}")
+    try:
+        with get_db() as db:
+            # One extra row tells whether there is a next page
+            results = search.search(db, query, limit + 1, offset)
+            logger.info(f"Found {len(results)} order/s for: {query}")
+            return {
+                "query": query,
+                "limit": limit,
+                "offset": offset,
+                "has_more": len(results) > limit,
+                "results": [{**_order_dict(order), "rank": rank} for order, rank in results[:limit]]
+            }
+
+    except Exception as e:
+        logger.error(f"Failed to search orders for {query}: {str(e)}", exc_info=True)
+        raise
+
+
 def get_order(order_id: str) -> OrderDB:
     """Get a specific order by ID"""
     logger.info(f"Fetching order: {order_id}")
@@ -88,7 +175,7 @@ def delete_order(order_id: str) -> dict:
     """Delete an order by ID"""
     logger.info(f"Deleting order: {order_id}")
     try:
-        with get_db() as db:
+        with get_write_db() as db:
             order = db.query(OrderDB).filter(OrderDB.id == order_id).first()
             if not order:
                 logger.warning(f"Order not found for deletion: {order_id}")
@@ -96,6 +183,7 @@ def delete_order(order_id: str) -> dict:
 
             db.delete(order)
             db.commit()
+            order_feed.publish("order.deleted", {"id": order_id})
 
             logger.info(f"Order deleted successfully: {order_id}")
             return {"message": "Order deleted successfully", "order_id": order_id}
@@ -104,4 +192,34 @@ def delete_order(order_id: str) -> dict:
         raise
     except Exception as e:
         logger.error(f"Failed to delete order {order_id}: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+
+def update_order_status(order_id: str, status: OrderStatus) -> OrderDB:
+    """Set the status of an order by ID"""
+    logger.info(f"Updating status of order {order_id} to {status.value}")
+    try:
+        with get_write_db() as db:
+            order = db.query(OrderDB).filter(OrderDB.id == order_id).first()
+            if not order:
+                logger.warning(f"Order not found for status update: {order_id}")
+                raise HTTPException(status_code=404, detail="Order not found")
+
+            previous_status = order.status
+            order.status = status.value
+            db.commit()
+            db.refresh(order)
+            order_feed.publish("order.status_changed", {
+                "id": order_id,
+                "status": status.value,
+                "previous_status": previous_status
+            })
+
+            logger.info(f"Order status updated successfully: {order_id}")
+            return order
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to update status of order {order_id}: {str(e)}", exc_info=True)
+        raise
@@ -27,4 +27,4 @@ class OrderDB(Base):
     delivery = Column(String(50), nullable=False)
     tree_stand = Column(Boolean, nullable=False)
     payment_method = Column(String(50), nullable=False)
-    status = Column(String(50), default="eingegangen")
+    status = Column(String(50), default="eingegangen")  # models.OrderStatus
@@ -0,0 +1,140 @@
+import logging
+from typing import List
+
+from sqlalchemy import text
+
+from db.database import engine, is_sqlite
+from db.schema import OrderDB
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = ["first_name", "last_name", "address", "postal_code", "city", "phone", "email"]
+
+# Trigrams can't match anything shorter
+MIN_TERM_LENGTH = 3
+
+# Postgres: one expression over all customer columns with a trigram index.
+# The expression in the queries has to be exactly the indexed one.
+PG_SEARCH_TEXT = "lower(" + " || ' ' || ".join(f"coalesce({c}, '')" for c in SEARCH_COLUMNS) + ")"
+
+
+def _create_postgres_index(conn):
+    conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS ix_orders_search_trgm ON orders USING gin (({PG_SEARCH_TEXT}) gin_trgm_ops)"
+    )
+
+
+def _create_sqlite_index(conn):
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders_search'"
+    ).first()
+    if exists:
+        return
+
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+    delete_old = """
+        DELETE FROM orders_search WHERE rowid IN (
+            SELECT rowid FROM orders_search
+            WHERE orders_search MATCH '{id} : "' || replace(old.id, '"', '""') || '"' AND id = old.id
+        );"""
+
+    # The index keeps its own copy of the customer columns, keyed on
+    # orders.id (indexed too, so triggers can find rows without a scan)
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE orders_search USING fts5(id, {columns}, tokenize='trigram')"
+    )
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER orders_search_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO orders_search(id, {columns}) VALUES (new.id, {new_values});
+        END""")
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER orders_search_delete AFTER DELETE ON orders BEGIN
+            {delete_old}
+        END""")
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER orders_search_update AFTER UPDATE OF id, {columns} ON orders BEGIN
+            {delete_old}
+            INSERT INTO orders_search(id, {columns}) VALUES (new.id, {new_values});
+        END""")
+    conn.exec_driver_sql(f"INSERT INTO orders_search(id, {columns}) SELECT id, {columns} FROM orders")
+
+
+def init_search_index():
+    """Creates the search index of the target DB if it doesn't exist yet"""
+    try:
+        with engine.begin() as conn:
+            if is_sqlite(engine):
+                _create_sqlite_index(conn)
+            else:
+                _create_postgres_index(conn)
+    except Exception as e:
+        logger.error(f"Failed to create order search index: {e}", exc_info=True)
+
+
+def search_terms(query: str) -> List[str]:
+    return query.lower().split()
+
+
+def is_searchable(query: str) -> bool:
+    """At least one term has to be long enough to use the index"""
+    return any(len(term) >= MIN_TERM_LENGTH for term in search_terms(query))
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _search_sqlite(db, terms: List[str], limit: int, offset: int):
+    # Long terms go to the index as quoted phrases (substring match, all
+    # required, any column but id), short ones only filter what the index found
+    phrases = " ".join('"' + term.replace('"', '""') + '"' for term in terms if len(term) >= MIN_TERM_LENGTH)
+    params = {"match": f"- {{id}} : ({phrases})", "limit": limit, "offset": offset}
+    conditions = ["orders_search MATCH :match"]
+    sqlite_text = "lower(" + " || ' ' || ".join(f"orders.{c}" for c in SEARCH_COLUMNS) + ")"
+    for i, term in enumerate(t for t in terms if len(t) < MIN_TERM_LENGTH):
+        params[f"term{i}"] = _like_pattern(term)
+        conditions.append(f"{sqlite_text} LIKE :term{i} ESCAPE '\\'")
+
+    rows = db.execute(text(f"""
+        SELECT orders.id, bm25(orders_search) AS rank
+        FROM orders_search JOIN orders ON orders.id = orders_search.id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    """), params).all()
+    # bm25 is lower for better matches
+    return [(row.id, -row.rank) for row in rows]
+
+
+def _search_postgres(db, terms: List[str], limit: int, offset: int):
+    params = {"query": " ".join(terms), "limit": limit, "offset": offset}
+    conditions = []
+    for i, term in enumerate(terms):
+        params[f"term{i}"] = _like_pattern(term)
+        conditions.append(f"{PG_SEARCH_TEXT} LIKE :term{i} ESCAPE '\\'")
+
+    rows = db.execute(text(f"""
+        SELECT id, word_similarity(:query, {PG_SEARCH_TEXT}) AS rank
+        FROM orders
+        WHERE {" AND ".join(conditions)}
+        ORDER BY rank DESC, order_date DESC
+        LIMIT :limit OFFSET :offset
+    """), params).all()
+    return [(row.id, row.rank) for row in rows]
+
+
+def search(db, query: str, limit: int, offset: int) -> List[tuple]:
+    """Returns (OrderDB, rank) of the orders matching all terms of the query, best match first"""
+    if not is_searchable(query):
+        return []
+    terms = search_terms(query)
+
+    if is_sqlite(engine):
+        ranked = _search_sqlite(db, terms, limit, offset)
+    else:
+        ranked = _search_postgres(db, terms, limit, offset)
+
+    orders = {o.id: o for o in db.query(OrderDB).filter(OrderDB.id.in_([order_id for order_id, _ in ranked]))}
+    return [(orders[order_id], rank) for order_id, rank in ranked if order_id in orders]
@@ -0,0 +1,129 @@
+import csv
+import logging
+import math
+import os
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import List
+
+from db.schema import OrderDB
+from models import Delivery
+
+logger = logging.getLogger(__name__)
+
+CENTROIDS_PATH = Path(__file__).parent / "data" / "postal_centroids.csv"
+DISPATCH_ROUTE_CAPACITY = int(os.getenv("DISPATCH_ROUTE_CAPACITY", "20"))
+DISPATCH_DEPOT_POSTAL_CODE = os.getenv("DISPATCH_DEPOT_POSTAL_CODE")
+
+# Most urgent first
+TIER_PRIORITY = [Delivery.Express, Delivery.Fast, Delivery.Standard]
+
+
+def _load_centroids() -> dict:
+    """Postal code prefix -> (lat, lon). Prefixes may have any length, the longest match wins."""
+    with open(CENTROIDS_PATH, encoding="utf-8") as f:
+        return {row["prefix"]: (float(row["lat"]), float(row["lon"])) for row in csv.DictReader(f)}
+
+
+CENTROIDS = _load_centroids()
+_PREFIX_LENGTHS = sorted({len(prefix) for prefix in CENTROIDS}, reverse=True)
+
+
+@lru_cache(maxsize=16384)
+def centroid(postal_code: str):
+    postal_code = postal_code.strip()
+    for length in _PREFIX_LENGTHS:
+        position = CENTROIDS.get(postal_code[:length])
+        if position:
+            return position
+    return None
+
+
+def _polar(position, depot):
+    """Angle and distance (km, equirectangular) of a position as seen from the depot"""
+    dy = (position[0] - depot[0]) * 111.2
+    dx = (position[1] - depot[1]) * 111.2 * math.cos(math.radians(depot[0]))
+    return math.atan2(dy, dx), math.hypot(dx, dy)
+
+
+def _sweep_order(postal_codes: List[str], depot) -> List[str]:
+    """
+    Orders postal codes by angle around the depot (sweep), nearest first on
+    equal angles. The sweep starts at the widest angular gap so that no
+    cluster is cut in half. Codes without a centroid go last.
+    """
+    known = {}
+    unknown = []
+    for code in postal_codes:
+        position = centroid(code)
+        if position is None:
+            unknown.append(code)
+        else:
+            known[code] = _polar(position, depot)
+
+    angles = sorted({angle for angle, _ in known.values()})
+    start = -math.pi
+    if len(angles) > 1:
+        gaps = [(angles[0] + 2 * math.pi - angles[-1], angles[0])]
+        gaps += [(b - a, b) for a, b in zip(angles, angles[1:])]
+        start = max(gaps)[1]
+
+    ordered = sorted(known, key=lambda c: ((known[c][0] - start) % (2 * math.pi), known[c][1], c))
+    return ordered + sorted(unknown)
+
+
+def _stop(order: OrderDB) -> dict:
+    return {
+        "order_id": order.id,
+        "name": f"{order.first_name} {order.last_name}",
+        "address": order.address,
+        "postal_code": order.postal_code,
+        "city": order.city,
+        "phone": order.phone,
+        "size": order.size,
+        "tree_stand": order.tree_stand,
+    }
+
+
+def plan_routes(orders: List[OrderDB], capacity: int = DISPATCH_ROUTE_CAPACITY, depot_postal_code: str = None) -> dict:
+    """
+    Splits the orders into routes of at most `capacity` stops. Tiers are
+    planned separately, sofort before express before standard; inside a
+    tier, routes cover neighbouring postal codes.
+    """
+    # Index once: tier -> postal code -> orders
+    by_tier = defaultdict(lambda: defaultdict(list))
+    for order in orders:
+        by_tier[order.delivery][order.postal_code.strip()].append(order)
+
+    depot = centroid(depot_postal_code or DISPATCH_DEPOT_POSTAL_CODE or "")
+    if depot is None:
+        positions = [p for p in (centroid(code) for tier in by_tier.values() for code in tier) if p]
+        depot = (
+            sum(p[0] for p in positions) / len(positions),
+            sum(p[1] for p in positions) / len(positions)
+        ) if positions else (0.0, 0.0)
+
+    routes = []
+    for tier in TIER_PRIORITY:
+        by_postal_code = by_tier.pop(tier.value, {})
+        stops = []
+        for code in _sweep_order(list(by_postal_code), depot):
+            stops.extend(sorted(by_postal_code[code], key=lambda o: (o.city, o.address)))
+
+        for start in range(0, len(stops), capacity):
+            route_stops = stops[start:start + capacity]
+            routes.append({
+                "route": len(routes) + 1,
+                "delivery": tier.value,
+                "postal_codes": sorted({o.postal_code for o in route_stops}),
+                "stops": [_stop(o) for o in route_stops],
+            })
+
+    unplanned = [o.id for tier in by_tier.values() for tier_orders in tier.values() for o in tier_orders]
+    if unplanned:
+        logger.warning(f"{len(unplanned)} order/s with unknown delivery tier were not planned")
+
+    logger.info(f"Planned {len(routes)} route/s for {len(orders) - len(unplanned)} order/s")
+    return {"capacity": capacity, "routes": routes, "unplanned": unplanned}
@@ -0,0 +1,262 @@
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from db.schema import OrderDB
+from models import priceList, Tree, Size, Package, Delivery
+
+logger = logging.getLogger(__name__)
+
+INVOICE_CACHE_DIR = Path(os.getenv("INVOICE_CACHE_DIR", "./invoices"))
+INVOICE_WORKERS = int(os.getenv("INVOICE_WORKERS", str(os.cpu_count() or 1)))
+# Trees (and what comes with them) are taxed at the reduced rate, the tree stand at the standard rate
+INVOICE_VAT_REDUCED = float(os.getenv("INVOICE_VAT_REDUCED", "7"))
+INVOICE_VAT_STANDARD = float(os.getenv("INVOICE_VAT_STANDARD", "19"))
+
+SELLER = {
+    "name": os.getenv("INVOICE_SELLER_NAME", "Dein Weihnachtsbaum.de"),
+    "address": os.getenv("INVOICE_SELLER_ADDRESS", ""),
+    "tax_id": os.getenv("INVOICE_SELLER_TAX_ID", ""),
+    "email": os.getenv("INVOICE_SELLER_EMAIL", "info@deinweihnachstbaum.de"),
+    "phone": os.getenv("INVOICE_SELLER_PHONE", "+49 151 2954 5560"),
+}
+
+# Bump when the template changes, so cached invoices are rendered again
+TEMPLATE_VERSION = 2
+
+# Below this, starting worker processes costs more than it saves
+POOL_THRESHOLD = 50
+
+
+def invoice_data(order: OrderDB) -> dict:
+    """Everything an invoice depends on, as plain data (picklable and hashable)"""
+    data = {c.name: getattr(order, c.name) for c in OrderDB.__table__.columns}
+    data["order_date"] = order.order_date.isoformat() if order.order_date else None
+    data.pop("status", None)
+    return {
+        "order": data,
+        "seller": SELLER,
+        "vat_rates": {"reduced": INVOICE_VAT_REDUCED, "standard": INVOICE_VAT_STANDARD},
+        "template": TEMPLATE_VERSION
+    }
+
+
+def invoice_key(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def invoice_filename(data: dict) -> str:
+    return f"Rechnung_{data['order']['id']}.html"
+
+
+def _line_items(order: dict, vat_rates: dict) -> list:
+    """
+    (name, gross price, VAT rate) per item. If today's price list doesn't add
+    up to the order's price, the tree stand is split off at its list price
+    and the rest is one line.
+    """
+    reduced, standard = vat_rates["reduced"], vat_rates["standard"]
+    stand = [("Christbaumständer", priceList["treeStand"], standard)] if order["tree_stand"] else []
+    fallback = [("Weihnachtsbaum-Bestellung", round(order["price"] - sum(p for _, p, _ in stand), 2), reduced)] + stand
+
+    try:
+        tree = Tree(order["tree"])
+        size = Size(order["size"])
+        package = Package(order["package"])
+        delivery = Delivery(order["delivery"])
+    except ValueError:
+        return fallback
+
+    # Package and delivery are ancillary to the tree and share its rate
+    items = [
+        (f"Weihnachtsbaum {tree.name}, Größe {size.name}", priceList[size] * priceList[tree], reduced),
+        (f"Paket {package.name}", priceList[package], reduced),
+        (f"Lieferung {delivery.value}", priceList[delivery], reduced),
+    ] + stand
+
+    if round(sum(price for _, price, _ in items), 2) != round(order["price"], 2):
+        return fallback
+    return [item for item in items if item[1]]
+
+
+def _vat_breakdown(items: list) -> list:
+    """(rate, net, VAT) per rate, as required on German invoices"""
+    gross_by_rate = {}
+    for _, price, rate in items:
+        gross_by_rate[rate] = gross_by_rate.get(rate, 0) + price
+
+    breakdown = []
+    for rate, gross in sorted(gross_by_rate.items()):
+        net = round(gross / (1 + rate / 100), 2)
+        breakdown.append((rate, net, round(gross - net, 2)))
+    return breakdown
+
+
+def _e(value) -> str:
+    return html.escape(str(value))
+
+
+def render_invoice(data: dict) -> bytes:
+    """Renders the invoice (HTML) of one order"""
+    order = data["order"]
+    seller = data["seller"]
+
+    gross = round(order["price"], 2)
+    items = _line_items(order, data["vat_rates"])
+    order_date = datetime.fromisoformat(order["order_date"]) if order["order_date"] else None
+    date = order_date.strftime("%d.%m.%Y") if order_date else ""
+
+    rows = "".join(
+        f"<tr><td>{_e(name)}</td><td class=\"amount\">{rate:g}%</td><td class=\"amount\">{price:.2f}€</td></tr>"
+        for name, price, rate in items
+    )
+    vat_rows = "".join(
+        f"<tr><td>Nettobetrag {rate:g}%</td><td></td><td class=\"amount\">{net:.2f}€</td></tr>"
+        f"<tr><td>MwSt. {rate:g}%</td><td></td><td class=\"amount\">{vat:.2f}€</td></tr>"
+        for rate, net, vat in _vat_breakdown(items)
+    )
+
+    body = f"""<!DOCTYPE html>
+<html lang="de">
+<head>
+    <meta charset="UTF-8">
+    <title>Rechnung {_e(order['id'])}</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; color: #333; max-width: 800px; margin: 0 auto; padding: 20px; }}
+        table {{ width: 100%; border-collapse: collapse; margin: 15px 0; }}
+        td, th {{ border-bottom: 1px solid #ddd; padding: 8px; text-align: left; }}
+        .amount {{ text-align: right; }}
+        .seller {{ text-align: right; font-size: 0.9em; }}
+    </style>
+</head>
+<body>
+    <div class="seller">
+        <strong>{_e(seller['name'])}</strong><br>
+        {_e(seller['address'])}<br>
+        {_e(seller['email'])} · {_e(seller['phone'])}<br>
+        Steuernummer/USt-IdNr.: {_e(seller['tax_id'])}
+    </div>
+
+    <p>
+        {_e(order['first_name'])} {_e(order['last_name'])}<br>
+        {_e(order['address'])}<br>
+        {_e(order['postal_code'])} {_e(order['city'])}
+    </p>
+
+    <h1>Rechnung</h1>
+    <p>
+        <strong>Rechnungsnummer:</strong> {_e(order['id'])}<br>
+        <strong>Rechnungsdatum / Leistungsdatum:</strong> {date}
+    </p>
+
+    <table>
+        <tr><th>Leistung</th><th class="amount">MwSt.</th><th class="amount">Betrag (brutto)</th></tr>
+        {rows}
+        {vat_rows}
+        <tr><th>Gesamtbetrag</th><th></th><th class="amount">{gross:.2f}€</th></tr>
+    </table>
+
+    <p>Zahlungsart: {_e(order['payment_method'])}</p>
+</body>
+</html>
+"""
+    return body.encode("utf-8")
+
+
+def _cache_path(key: str) -> Path:
+    return INVOICE_CACHE_DIR / key[:2] / f"{key}.html"
+
+
+def _store(key: str, document: bytes):
+    path = _cache_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(document)
+    tmp.replace(path)
+
+
+def get_invoice(order: OrderDB) -> bytes:
+    """Invoice of one order, from the cache if the order hasn't changed"""
+    data = invoice_data(order)
+    path = _cache_path(invoice_key(data))
+    if path.exists():
+        return path.read_bytes()
+
+    document = render_invoice(data)
+    _store(path.stem, document)
+    return document
+
+
+def _pool_context():
+    # Forking the server process, which runs several threads (threadpool,
+    # background workers, trace exporter), can deadlock the children.
+    # render_invoice only needs models and db.schema, so fresh processes do.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def render_invoices(orders: List[OrderDB]) -> List[tuple]:
+    """
+    Makes sure all invoices are in the cache and returns (filename, path)
+    for each order. Missing invoices are rendered in a process pool.
+    """
+    documents = []
+    missing = []
+    for order in orders:
+        data = invoice_data(order)
+        key = invoice_key(data)
+        documents.append((invoice_filename(data), _cache_path(key)))
+        if not _cache_path(key).exists():
+            missing.append((key, data))
+
+    logger.info(f"Rendering {len(missing)} of {len(orders)} invoice/s")
+    if len(missing) < POOL_THRESHOLD or INVOICE_WORKERS < 2:
+        rendered = map(render_invoice, [data for _, data in missing])
+        for (key, _), document in zip(missing, rendered):
+            _store(key, document)
+    else:
+        with ProcessPoolExecutor(max_workers=INVOICE_WORKERS, mp_context=_pool_context()) as pool:
+            chunksize = max(1, len(missing) // (INVOICE_WORKERS * 4))
+            rendered = pool.map(render_invoice, [data for _, data in missing], chunksize=chunksize)
+            for (key, _), document in zip(missing, rendered):
+                _store(key, document)
+
+    return documents
+
+
+class _ZipStream:
+    """Write-only file object that hands out what has been written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(documents: List[tuple]):
+    """Yields a zip archive of the documents piece by piece, without building it in memory"""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, path in documents:
+            archive.write(path, arcname=filename)
+            yield stream.pop()
+    yield stream.pop()
@@ -4,14 +4,24 @@ import os
 import stripe
 from starlette.middleware.cors import CORSMiddleware
 
+import background
+import bulk_import
+import dispatch
 import in_memory
-from db import database, order_service
-from fastapi import FastAPI, Request, HTTPException
+import invoices
+import order_feed
+import tracing
+from db import database, order_service, search
+from fastapi import FastAPI, Request, HTTPException, Header
+from fastapi.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+from datetime import date, datetime, time, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
+from contextlib import asynccontextmanager
 
 from db.migration import migrate_orders
-from models import OrderIn, Order, PaymentMethod
+from models import OrderIn, Order, PaymentMethod, OrderStatus
 from payments import stripe_payment, paypal_payment
 from payments.helper import complete_payment
 
@@ -27,7 +37,15 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background.start()
+    yield
+    # Finish (or persist) queued emails etc. before the process goes away
+    await run_in_threadpool(background.shutdown)
+    tracing.flush()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,6 +61,7 @@ app.add_middleware(
 )
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 database.init_db()
+search.init_search_index()
 
 @app.post("/checkout")
 async def create_checkout_session(order_in: OrderIn):
@@ -51,14 +70,15 @@ async def create_checkout_session(order_in: OrderIn):
     logging.info(f"checkout session created by {order.customer.email}, price: {order.price}")
     checkout_url = os.getenv("SUCCESS_URL")
 
-    if order.payment_method == PaymentMethod.Stripe:
-        checkout_session = await stripe_payment.create_checkout(order)
-        checkout_url = checkout_session.url
-    elif order.payment_method == PaymentMethod.Paypal:
-        return "Not implemented"
-    else:
-        in_memory.new_order(order)
-        await complete_payment(order.id)
+    with tracing.span("POST /checkout", order_id=order.id, payment_method=order.payment_method.value):
+        if order.payment_method == PaymentMethod.Stripe:
+            checkout_session = await stripe_payment.create_checkout(order)
+            checkout_url = checkout_session.url
+        elif order.payment_method == PaymentMethod.Paypal:
+            return "Not implemented"
+        else:
+            in_memory.new_order(order)
+            await complete_payment(order.id)
 
     return {
         "order_id": order.id,
@@ -70,15 +90,80 @@ async def create_checkout_session(order_in: OrderIn):
 async def get_orders():
     return order_service.get_all_orders()
 
+@app.get("/orders/search")
+async def search_orders(q: str, limit: int = 20, offset: int = 0):
+    if not search.is_searchable(q):
+        raise HTTPException(status_code=400, detail=f"At least one search term needs at least {search.MIN_TERM_LENGTH} characters")
+    limit = max(1, min(limit, 100))
+    return order_service.search_orders(q, limit, max(0, offset))
+
+@app.get("/orders/feed")
+async def order_feed_stream(request: Request, cursor: str = None, last_event_id: str = Header(None)):
+    # Browsers resume with the Last-Event-ID header, other clients may pass ?cursor=
+    if cursor is None:
+        cursor = last_event_id
+    return StreamingResponse(
+        order_feed.stream(request, cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.patch("/orders/{order_id}/status")
+async def update_order_status(order_id: str, status: OrderStatus):
+    return order_service.update_order_status(order_id, status)
+
+@app.post("/orders/import")
+async def import_orders(request: Request):
+    body = (await request.body()).decode("utf-8-sig")
+    try:
+        if "csv" in request.headers.get("content-type", ""):
+            rows = bulk_import.parse_csv(body)
+        else:
+            rows = bulk_import.parse_json(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Hundreds of rows: keep the event loop (and the order feed) responsive
+    return await run_in_threadpool(bulk_import.import_orders, rows)
+
+@app.get("/orders/{order_id}/invoice")
+async def get_invoice(order_id: str):
+    order = order_service.get_order(order_id)
+    if order.status == OrderStatus.Cancelled.value:
+        raise HTTPException(status_code=409, detail="Order was cancelled")
+    return Response(invoices.get_invoice(order), media_type="text/html; charset=utf-8")
+
+@app.get("/invoices")
+async def get_invoices(start: date, end: date):
+    # end is inclusive
+    orders = order_service.get_orders_between(datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min))
+    documents = await run_in_threadpool(invoices.render_invoices, orders)
+    return StreamingResponse(
+        invoices.stream_zip(documents),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="Rechnungen_{start}_{end}.zip"'}
+    )
+
 @app.get("/orders/{order_id:path}")
 async def get_order(order_id: str):
     return order_service.get_order(order_id)
 
 
+@app.get("/dispatch/plan")
+async def dispatch_plan(capacity: int = dispatch.DISPATCH_ROUTE_CAPACITY, depot_postal_code: str = None):
+    if capacity < 1:
+        raise HTTPException(status_code=400, detail="capacity must be at least 1")
+    return dispatch.plan_routes(order_service.get_open_orders(), capacity, depot_postal_code)
+
+
 @app.post("/stripe/webhook")
 async def stripe_webhook(request: Request):
     return await stripe_payment.stripe_webhook(request)
 
+@app.get("/background/metrics")
+async def background_metrics():
+    return background.metrics()
+
 @app.get("/migrate")
 async def migrate():
     migrate_orders()
@@ -34,6 +34,13 @@ class PaymentMethod(Enum):
     Cash = "cash"
 
 
+class OrderStatus(Enum):
+    Received = "eingegangen"
+    InDelivery = "in_zustellung"
+    Delivered = "geliefert"
+    Cancelled = "storniert"
+
+
 class Customer(BaseModel):
     first_name: str
     last_name: str
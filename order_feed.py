@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+FEED_BUFFER_SIZE = 10000
+HEARTBEAT_SECONDS = 15
+
+# All clients read from this one buffer with their own cursor, so an event
+# is serialized once no matter how many dashboards are connected.
+_events = deque(maxlen=FEED_BUFFER_SIZE)
+_lock = threading.Lock()
+_last_id = 0
+
+# Event ids are "<epoch>-<seq>". seq restarts with every process, so a
+# cursor from another epoch can't be resumed and gets a reset instead.
+EPOCH = format(time.time_ns(), "x")
+
+_loop = None
+_new_events = None
+
+
+def publish(event_type: str, data: dict):
+    """
+    Add an event to the feed; safe to call from any thread. Best effort: it
+    runs after the DB commit, so it must never fail the write it reports.
+    """
+    global _last_id
+    try:
+        with _lock:
+            payload = json.dumps(data, default=str)
+            _last_id += 1
+            _events.append((_last_id, f"id: {EPOCH}-{_last_id}\nevent: {event_type}\ndata: {payload}\n\n"))
+
+        # The loop of the first client may be gone (e.g. a CLI or test run)
+        loop = _loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(_wake_clients)
+    except Exception as e:
+        logger.error(f"Failed to publish {event_type} to the order feed: {str(e)}", exc_info=True)
+
+
+def _wake_clients():
+    global _new_events
+    _new_events.set()
+    _new_events = asyncio.Event()
+
+
+def parse_cursor(cursor: str):
+    """Sequence number of a cursor of this process, None if it's from another one (or malformed)"""
+    epoch, _, seq = cursor.rpartition("-")
+    if epoch != EPOCH or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+def events_after(cursor: int):
+    """
+    Returns the events after the cursor, or None if the client missed events
+    that are no longer buffered.
+    """
+    with _lock:
+        if cursor > _last_id:
+            return None
+        if not _events:
+            return []
+        first_id = _events[0][0]
+        if cursor < first_id - 1:
+            return None
+        # Event ids are contiguous, so the cursor maps straight to a position
+        return [message for _, message in islice(_events, cursor - first_id + 1, None)]
+
+
+def _reset_message(cursor: int) -> str:
+    # Tells the client to reload the full order list once and continue from here
+    return f"id: {EPOCH}-{cursor}\nevent: reset\ndata: {{}}\n\n"
+
+
+async def stream(request, cursor: str = None):
+    """Server-Sent Events for the admin dashboard, resuming after cursor if given"""
+    global _loop, _new_events
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.get_running_loop()
+        _new_events = asyncio.Event()
+
+    if cursor is None:
+        seq = _last_id
+        yield f"id: {EPOCH}-{seq}\nevent: ready\ndata: {{}}\n\n"
+    else:
+        seq = parse_cursor(cursor)
+        if seq is None:
+            logger.info(f"Feed cursor {cursor} is from another process, sending reset")
+            seq = _last_id
+            yield _reset_message(seq)
+
+    while not await request.is_disconnected():
+        waiter = _new_events
+        messages = events_after(seq)
+        if messages is None:
+            logger.info(f"Feed client at {EPOCH}-{seq} is too far behind, sending reset")
+            seq = _last_id
+            yield _reset_message(seq)
+            continue
+
+        if messages:
+            seq += len(messages)
+            yield "".join(messages)
+            continue
+
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout=HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": heartbeat\n\n"
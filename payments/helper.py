@@ -1,27 +1,87 @@
 import logging
+import queue
+import time
 
 from fastapi import HTTPException
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
+import background
 import in_memory
 import smtp
+import tracing
 from db import order_service
+from models import Order
 
 logger = logging.getLogger(__name__)
-executor = ThreadPoolExecutor(max_workers=3)
+
+
+@background.task("order_confirmation_emails")
+def send_confirmation_emails(order: dict, parent_span_id: str = None):
+    order = Order.model_validate(order)
+    # Same trace as the checkout, below the span that queued the emails
+    tracing.current_span().link_order(order.id)
+    tracing.current_span().link_parent(parent_span_id)
+    with tracing.span("smtp.send_new_order_received_admin"):
+        smtp.send_new_order_received_admin(order)
+    with tracing.span("smtp.send_order_success_customer"):
+        smtp.send_order_success_customer(order.customer.email, order)  # type: ignore
+
+
+@background.task("bulk_import_admin_email")
+def send_bulk_import_admin_email(orders: list):
+    with tracing.span("smtp.send_bulk_import_admin"):
+        smtp.send_bulk_import_admin([Order.model_validate(order) for order in orders])
+
+
+@background.task("order_customer_email")
+def send_customer_email(order: dict):
+    order = Order.model_validate(order)
+    tracing.current_span().link_order(order.id)
+    with tracing.span("smtp.send_order_success_customer"):
+        smtp.send_order_success_customer(order.customer.email, order)  # type: ignore
+
 
 async def complete_payment(order_id):
     try:
-        order = in_memory.get_order(order_id)
-        order_service.create_order(order)
-        in_memory.delete_order(order.id)
+        with tracing.span("complete_payment", order_id=order_id):
+            order = in_memory.get_order(order_id)
+            order_service.create_order(order)
+            in_memory.delete_order(order.id)
 
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(executor, smtp.send_new_order_received_admin, order)
-        await loop.run_in_executor(executor, smtp.send_order_success_customer, order.customer.email, order)  # type: ignore
+            # The order is saved, the emails don't have to hold up the response
+            background.submit(
+                "order_confirmation_emails",
+                order=order.model_dump(mode="json"),
+                parent_span_id=tracing.current_span().span_id
+            )
 
         logging.info("Successfully saved order in database")
     except Exception as e:
         logging.error(f"saving order: {e}")
-        raise HTTPException(status_code=400)
\ No newline at end of file
+        raise HTTPException(status_code=400)
+
+
+def queue_confirmation_emails(orders):
+    """
+    Send the confirmations for imported orders in the background, one admin
+    summary for all. One task per customer email, so a task cut off at
+    shutdown only repeats its own email. Waits for room in the queue up to
+    BACKGROUND_SUBMIT_TIMEOUT for the whole batch, whatever doesn't fit by
+    then is spilled right away.
+    """
+    if not orders:
+        return
+    data = [order.model_dump(mode="json") for order in orders]
+    deadline = time.monotonic() + background.BACKGROUND_SUBMIT_TIMEOUT
+    tasks = [("bulk_import_admin_email", {"orders": data})] + [("order_customer_email", {"order": order}) for order in data]
+
+    spilled = 0
+    for name, kwargs in tasks:
+        if spilled:
+            future = background.submit(name, **kwargs)
+        else:
+            future = background.submit_wait(name, timeout=max(0.0, deadline - time.monotonic()), **kwargs)
+        if future.done() and isinstance(future.exception(), queue.Full):
+            spilled += 1
+
+    if spilled:
+        logger.warning(f"{spilled} of {len(tasks)} bulk import email task/s spilled, the background queue is full")
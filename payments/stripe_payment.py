@@ -4,63 +4,68 @@ import stripe
 from fastapi import Request, HTTPException
 
 import in_memory
+import tracing
 from payments.helper import complete_payment
 
 logger = logging.getLogger(__name__)
 
 async def create_checkout(order):
-    session = stripe.checkout.Session.create(
-        line_items=[{
-            "price_data": {
-                "currency": "eur",
-                "product_data": {"name": "FastAPI Stripe Checkout"},
-                "unit_amount": int(order.price * 100),
+    with tracing.span("stripe.create_checkout_session"):
+        session = stripe.checkout.Session.create(
+            line_items=[{
+                "price_data": {
+                    "currency": "eur",
+                    "product_data": {"name": "FastAPI Stripe Checkout"},
+                    "unit_amount": int(order.price * 100),
+                },
+                "quantity": 1,
+            }],
+            metadata={
+                "request_id": order.id
             },
-            "quantity": 1,
-        }],
-        metadata={
-            "request_id": order.id
-        },
-        mode="payment",
-        success_url=os.getenv("SUCCESS_URL"),
-        cancel_url=os.getenv("CANCEL_URL"),
-        customer_email=order.customer.email,
-    )
+            mode="payment",
+            success_url=os.getenv("SUCCESS_URL"),
+            cancel_url=os.getenv("CANCEL_URL"),
+            customer_email=order.customer.email,
+        )
 
     in_memory.new_order(order)
     return session
 
 async def stripe_webhook(request: Request):
-    payload = await request.body()
-    sig_header = request.headers.get("stripe-signature")
+    with tracing.span("POST /stripe/webhook") as webhook_span:
+        payload = await request.body()
+        sig_header = request.headers.get("stripe-signature")
 
-    try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, os.getenv("STRIPE_WEBHOOK_SECRET")
-        )
+        try:
+            event = stripe.Webhook.construct_event(
+                payload, sig_header, os.getenv("STRIPE_WEBHOOK_SECRET")
+            )
 
-    except stripe.error.SignatureVerificationError as e:
-        logging.error(f"Invalid signature: {e}")
-        raise HTTPException(status_code=400)
-    except Exception as e:
-        logging.error(f"Webhook error: {e}")
-        raise HTTPException(status_code=400)
+        except stripe.error.SignatureVerificationError as e:
+            logging.error(f"Invalid signature: {e}")
+            raise HTTPException(status_code=400)
+        except Exception as e:
+            logging.error(f"Webhook error: {e}")
+            raise HTTPException(status_code=400)
 
-    event_type = event["type"]
+        event_type = event["type"]
+        webhook_span.set_attribute("stripe.event_type", event_type)
 
-    if event_type == "checkout.session.completed":
-        logging.info("Received checkout session completed")
+        if event_type == "checkout.session.completed":
+            logging.info("Received checkout session completed")
 
-        # Retrieve session and metadata if needed
-        session = event["data"]["object"]
+            # Retrieve session and metadata if needed
+            session = event["data"]["object"]
 
-        metadata = session.get("metadata", {})
+            metadata = session.get("metadata", {})
 
-        order_id = metadata.get("request_id")
-        if not order_id:
-            logging.error("Invalid metadata checkout")
-            raise HTTPException(status_code=400)
+            order_id = metadata.get("request_id")
+            if not order_id:
+                logging.error("Invalid metadata checkout")
+                raise HTTPException(status_code=400)
 
-        await complete_payment(order_id)
+            webhook_span.link_order(order_id)
+            await complete_payment(order_id)
 
-    return {"status": "success"}
\ No newline at end of file
+        return {"status": "success"}
\ No newline at end of file
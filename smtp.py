@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import List
 from models import Order, PaymentMethod
 import resend
 
@@ -66,6 +67,28 @@ def send_new_order_received_admin(order: Order):
     send_email(admin_email, subject, body)
 
 
+def send_bulk_import_admin(orders: List[Order]):
+    """Sends one plain text summary to the admin for a whole bulk import."""
+    admin_email = os.getenv("ADMIN_EMAIL")
+
+    if not admin_email:
+        logging.error("Missing ADMIN_EMAIL environment variable.")
+        return
+
+    subject = f"{len(orders)} Bestellungen importiert"
+    lines = [
+        f"{order.id}: {order.customer.first_name} {order.customer.last_name}, {order.price:.2f}€"
+        for order in orders
+    ]
+    body = (
+        f"Es wurden {len(orders)} Bestellungen importiert.\n\n"
+        + "\n".join(lines)
+        + f"\n\nGesamtbetrag: {sum(order.price for order in orders):.2f}€\n"
+    )
+
+    send_email(admin_email, subject, body)
+
+
 # --- New Professional Customer Email (German/HTML) ---
 def send_order_success_customer(customer_email: str, order: Order):
     """
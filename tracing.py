@@ -0,0 +1,267 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Config
+# -----------------------------
+# TRACE_EXPORTER: "none" (default), "file" or "otlp"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "chrismas-bacon")
+
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL_SECONDS = 2.0
+EXPORT_QUEUE_SIZE = 4096
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class _Trace:
+    """Spans of one request, exported together once the root span ends."""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.order_id = None
+        self.spans = []
+
+    def link_order(self, order_id: str):
+        # The order id is the correlation key: checkout and webhook are two
+        # separate HTTP requests, but both end up under the same trace id.
+        self.order_id = order_id
+        self.trace_id = trace_id_for_order(order_id)
+
+    @property
+    def sampled(self) -> bool:
+        # Deterministic on the trace id, so both requests of an order agree
+        return int(self.trace_id[:16], 16) / 2 ** 64 < TRACE_SAMPLE_RATE
+
+
+class Span:
+    def __init__(self, name: str, trace: _Trace, parent: "Span" = None, attributes: dict = None):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def link_order(self, order_id: str):
+        """Attach the order id once it is known (e.g. after parsing a webhook)"""
+        self.trace.link_order(order_id)
+        self.attributes["order.id"] = order_id
+
+    def link_parent(self, span_id: str):
+        """Continue a span of another thread or process (e.g. the one that submitted a background task)"""
+        if span_id and self.parent_id is None:
+            self.parent_id = span_id
+
+    def end(self):
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._start_perf)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "order_id": self.trace.order_id,
+            "start": self.start_ns,
+            "end": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    span_id = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def link_order(self, order_id: str):
+        pass
+
+    def link_parent(self, span_id: str):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def trace_id_for_order(order_id: str) -> str:
+    try:
+        return uuid.UUID(order_id).hex
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_OID, order_id).hex
+
+
+@contextmanager
+def span(name: str, order_id: str = None, **attributes):
+    """
+    Records a span around the wrapped block. Spans nest through a context
+    variable; the outermost one starts a trace, keyed on order_id if given.
+    """
+    if TRACE_EXPORTER == "none":
+        yield _NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    if parent is None:
+        trace = _Trace(uuid.uuid4().hex)
+    else:
+        trace = parent.trace
+
+    current = Span(name, trace, parent, attributes)
+    if order_id:
+        current.link_order(order_id)
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+        trace.spans.append(current)
+        if parent is None and trace.sampled:
+            _exporter.submit(trace.spans)
+
+
+def current_span():
+    return _current_span.get() or _NOOP_SPAN
+
+
+# -----------------------------
+# Export
+# -----------------------------
+class _Exporter:
+    """Batches finished spans and writes them from a background thread"""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, spans):
+        self._ensure_started()
+        for s in spans:
+            try:
+                self._queue.put_nowait(s)
+            except queue.Full:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._drain(EXPORT_INTERVAL_SECONDS)
+            if batch:
+                self._export(batch)
+
+    def _drain(self, timeout: float) -> list:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < EXPORT_BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _export(self, batch):
+        try:
+            if TRACE_EXPORTER == "file":
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    for s in batch:
+                        f.write(json.dumps(s.to_dict(), default=str) + "\n")
+            elif TRACE_EXPORTER == "otlp":
+                requests.post(f"{TRACE_OTLP_ENDPOINT}/v1/traces", json=_to_otlp(batch), timeout=5)
+        except Exception as e:
+            logger.error(f"Exporting {len(batch)} span/s failed: {e}")
+
+    def flush(self):
+        batch = self._drain(0)
+        while batch:
+            self._export(batch)
+            batch = self._drain(0)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(batch) -> dict:
+    spans = []
+    for s in batch:
+        attributes = dict(s.attributes)
+        if s.trace.order_id:
+            attributes["order.id"] = s.trace.order_id
+        otlp_span = {
+            "traceId": s.trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]
+            },
+            "scopeSpans": [{"scope": {"name": "chrismas_bacon"}, "spans": spans}],
+        }]
+    }
+
+
+_exporter = _Exporter()
+
+
+def flush():
+    """Export everything still queued (called on shutdown)"""
+    _exporter.flush()
+
+
+atexit.register(flush)